@@ -1,13 +1,244 @@
 from pyrogram import Client
 import os
-from dotenv import load_dotenv, set_key, find_dotenv
+from dotenv import load_dotenv, set_key, find_dotenv, dotenv_values
 import logging
 import builtins
 import requests
 import asyncio
+import base64
+import errno
+import shutil
+import tempfile
+import threading
+from dataclasses import dataclass, field
+from typing import List
 from pyrogram.errors import FloodWait, UserPrivacyRestricted, PeerIdInvalid
+from cryptography.fernet import Fernet, InvalidToken
+from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
 logging.basicConfig(level=logging.INFO)
 
+# Session string encryption - เก็บในรูปแบบ enc:v1:{salt}:{fernet token}
+SESSION_ENCRYPTION_PREFIX = "enc:v1:"
+# จำนวน session string ที่ถอดรหัสแล้วเก็บไว้ใน memory สูงสุด
+SESSION_CACHE_SIZE = 256
+
+_session_encryption_key = None
+# salt เดียวต่อ process สำหรับการเข้ารหัส เพื่อให้ KDF ทำงานเพียงครั้งเดียวต่อ process
+_process_salt = os.urandom(16)
+# ป้องกันการ read-modify-write ไฟล์ .env พร้อมกันจากหลาย thread
+_env_file_lock = threading.Lock()
+# Fernet ที่ derive แล้ว (ตาม salt) - lock กันไม่ให้ scrypt ทำงานซ้ำเมื่อ cache miss พร้อมกัน
+_fernet_cache = {}
+_fernet_lock = threading.Lock()
+# session string ที่ถอดรหัสแล้ว (ตามค่าที่เก็บใน .env)
+_session_cache = {}
+_session_cache_lock = threading.Lock()
+
+
+def load_session_encryption_key() -> str:
+    """
+    อ่าน passphrase สำหรับเข้ารหัส session string
+    ต้องมาจาก environment ของ process (SESSION_ENCRYPTION_KEY) หรือไฟล์ secret แยก
+    (SESSION_ENCRYPTION_KEY_FILE) เท่านั้น ห้ามเก็บไว้ในไฟล์ .env เดียวกับ session string
+    """
+    global _session_encryption_key
+    if _session_encryption_key is None:
+        dotenv_file = find_dotenv(usecwd=True)
+        if dotenv_file and "SESSION_ENCRYPTION_KEY" in dotenv_values(dotenv_file):
+            raise RuntimeError(
+                "SESSION_ENCRYPTION_KEY must not be stored in .env; "
+                "set it in the process environment or via SESSION_ENCRYPTION_KEY_FILE"
+            )
+        key_file = os.getenv("SESSION_ENCRYPTION_KEY_FILE")
+        if key_file:
+            with open(key_file, "r") as file:
+                passphrase = file.read().strip()
+        else:
+            passphrase = os.getenv("SESSION_ENCRYPTION_KEY")
+        if not passphrase:
+            raise RuntimeError(
+                "SESSION_ENCRYPTION_KEY is not set; "
+                "set it in the process environment or via SESSION_ENCRYPTION_KEY_FILE"
+            )
+        _session_encryption_key = passphrase
+    return _session_encryption_key
+
+
+def _derive_fernet(salt: bytes) -> Fernet:
+    """สร้าง Fernet key จาก passphrase ด้วย scrypt (cache ตาม salt)"""
+    with _fernet_lock:
+        fernet = _fernet_cache.get(salt)
+        if fernet is None:
+            passphrase = load_session_encryption_key()
+            kdf = Scrypt(salt=salt, length=32, n=2**15, r=8, p=1)
+            fernet = Fernet(base64.urlsafe_b64encode(kdf.derive(passphrase.encode())))
+            if len(_fernet_cache) >= SESSION_CACHE_SIZE:
+                _fernet_cache.pop(next(iter(_fernet_cache)))
+            _fernet_cache[salt] = fernet
+        return fernet
+
+
+def encrypt_session_string(session_string: str) -> str:
+    """
+    เข้ารหัส session string ก่อนบันทึกลงไฟล์ .env
+    ใช้ CPU หนัก (scrypt) ในครั้งแรก ควรเรียกผ่าน asyncio.to_thread จาก async code
+    """
+    salt = _process_salt
+    token = _derive_fernet(salt).encrypt(session_string.encode())
+    return f"{SESSION_ENCRYPTION_PREFIX}{base64.urlsafe_b64encode(salt).decode()}:{token.decode()}"
+
+
+def _get_cached_session_string(stored_value: str) -> str | None:
+    """คืน session string ที่ถอดรหัสไว้แล้ว หรือ None หากยังไม่อยู่ใน cache"""
+    with _session_cache_lock:
+        return _session_cache.get(stored_value)
+
+
+def decrypt_session_string(account_name: str, stored_value: str) -> str:
+    """
+    ถอดรหัส session string จากไฟล์ .env
+    ผลลัพธ์ถูก cache ตามค่าที่เข้ารหัส จึงเสีย KDF เพียงครั้งเดียวต่อบัญชีต่อ process
+    ค่าที่ยังไม่เข้ารหัส (แบบเดิม) จะถูกส่งคืนตามเดิม
+    ใช้ CPU หนัก (scrypt) ในครั้งแรก ควรเรียกผ่าน load_session_string จาก async code
+    """
+    if not stored_value.startswith(SESSION_ENCRYPTION_PREFIX):
+        return stored_value
+    cached = _get_cached_session_string(stored_value)
+    if cached is not None:
+        return cached
+    try:
+        # ValueError ครอบคลุม: ไม่มี ":" คั่น, base64 ผิดรูปแบบ (binascii.Error) และ decode ไม่ได้
+        salt, token = stored_value[len(SESSION_ENCRYPTION_PREFIX):].split(":", 1)
+        session_string = _derive_fernet(base64.urlsafe_b64decode(salt)).decrypt(token.encode()).decode()
+    except (ValueError, InvalidToken):
+        raise RuntimeError(f"corrupt or undecryptable session string for {account_name}") from None
+    with _session_cache_lock:
+        if len(_session_cache) >= SESSION_CACHE_SIZE:
+            _session_cache.pop(next(iter(_session_cache)))
+        _session_cache[stored_value] = session_string
+    return session_string
+
+
+async def load_session_string(account_name: str) -> str | None:
+    """อ่านและถอดรหัส session string ของบัญชีโดยไม่ block event loop"""
+    stored_value = os.getenv(f"{account_name}_session_string")
+    if stored_value is None:
+        return None
+    if not stored_value.startswith(SESSION_ENCRYPTION_PREFIX):
+        # ค่าแบบเดิมที่ยังไม่เข้ารหัส: แจ้งเตือนเท่านั้น (migrate_plaintext_session_strings จัดการตอน start)
+        if stored_value:
+            logging.warning(f"Plaintext session string found for {account_name}; restart to encrypt it in .env")
+        return stored_value
+    # cache hit ตรวจบน event loop ได้ทันที ไปที่ thread เฉพาะตอน cache miss
+    cached = _get_cached_session_string(stored_value)
+    if cached is not None:
+        return cached
+    return await asyncio.to_thread(decrypt_session_string, account_name, stored_value)
+
+
+def _replace_file_contents(path: str, content: str) -> None:
+    """เขียนไฟล์แบบ atomic (temp file ในโฟลเดอร์เดียวกัน + os.replace) เพื่อไม่ให้ผู้อ่านเห็นไฟล์ที่เขียนไม่ครบ"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".env.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as file:
+            file.write(content)
+            file.flush()
+            os.fsync(file.fileno())
+        shutil.copymode(path, tmp_path)
+        try:
+            os.replace(tmp_path, path)
+        except OSError as e:
+            # .env ที่ bind mount เป็นไฟล์เดี่ยว (docker-compose) ไม่สามารถ rename ทับได้
+            if e.errno != errno.EBUSY:
+                raise
+            logging.warning(f"Cannot atomically replace {path} (bind-mounted file), writing in place")
+            with open(path, "w") as file:
+                file.write(content)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def write_session_string_to_env(account_name: str, session_string: str) -> None:
+    """เข้ารหัสและบันทึก session string ของบัญชีลงไฟล์ .env"""
+    dotenv_file = find_dotenv(usecwd=True)
+    # เข้ารหัสก่อนบันทึก (ไม่เก็บ session string แบบ plaintext)
+    encrypted_session = encrypt_session_string(session_string)
+
+    with _env_file_lock:
+        # อ่านไฟล์ทั้งหมด
+        with open(dotenv_file, "r") as file:
+            content = file.read()
+
+        # แทนที่หรือเพิ่มบรรทัดใหม่
+        lines = content.split('\n')
+        new_lines = []
+        found = False
+
+        for line in lines:
+            if line.strip().startswith(f'{account_name}_session_string='):
+                new_lines.append(f"{account_name}_session_string={encrypted_session}")
+                found = True
+            else:
+                new_lines.append(line)
+
+        # ถ้าไม่เจอ ให้เพิ่มใหม่
+        if not found:
+            new_lines.append(f"{account_name}_session_string={encrypted_session}")
+
+        # เขียนกลับ
+        _replace_file_contents(dotenv_file, '\n'.join(new_lines))
+
+        # อัปเดตค่าใน process ให้ตรงกับไฟล์ (load_dotenv ไม่ override ค่าเดิม)
+        os.environ[f"{account_name}_session_string"] = encrypted_session
+
+    # ไม่ log เนื้อหาไฟล์ .env เพราะมีข้อมูลลับ
+    logging.info(f"Updated {account_name}_session_string in {dotenv_file}")
+
+
+def migrate_plaintext_session_strings() -> None:
+    """เข้ารหัส session string แบบ plaintext (จากเวอร์ชันเดิม) ที่ยังเหลืออยู่ในไฟล์ .env"""
+    dotenv_file = find_dotenv(usecwd=True)
+    if not dotenv_file:
+        return
+    for key, value in dotenv_values(dotenv_file).items():
+        if key.endswith("_session_string") and value and not value.startswith(SESSION_ENCRYPTION_PREFIX):
+            account_name = key[:-len("_session_string")]
+            logging.warning(f"Encrypting plaintext session string for {account_name}")
+            write_session_string_to_env(account_name, value)
+
+
+# Result models - ใช้ dataclass แบบ slots เพื่อลด memory และให้ orjson serialize ได้โดยตรง
+@dataclass(slots=True)
+class InviteResult:
+    """ผลการเชิญผู้ใช้หนึ่งคน"""
+    user: str
+    status: str
+
+@dataclass(slots=True)
+class FailedInviteResult(InviteResult):
+    """ผลการเชิญที่ล้มเหลวพร้อมเหตุผล"""
+    reason: str
+
+@dataclass(slots=True)
+class WaitingInviteResult(InviteResult):
+    """ผลการเชิญที่ติด rate limit (FloodWait)"""
+    wait_seconds: int
+
+@dataclass(slots=True)
+class InviteOutcome:
+    """ผลลัพธ์รวมของการเชิญ"""
+    status: str
+    results: List[InviteResult] = field(default_factory=list)
+
+@dataclass(slots=True)
+class InviteError:
+    """ผลลัพธ์เมื่อเกิดข้อผิดพลาดในระดับฟังก์ชัน"""
+    status: str
+    message: str
+    results: List[InviteResult] = field(default_factory=list)
+
+
 class TelegramSessionManager():
 
     def __init__(self,account_name: str ,session_string: str = None):
@@ -78,7 +309,8 @@ class TelegramSessionManager():
             # Export session string
             session_string = await self.app.export_session_string()
             self.session_string = session_string
-            self.update_env()
+            # เข้ารหัสและเขียนไฟล์ใน thread แยกเพื่อไม่ block event loop
+            await asyncio.to_thread(self.update_env)
             logging.info(f"✅ Session string created and updated .env successfully!")
             return self.session_string
             
@@ -89,7 +321,7 @@ class TelegramSessionManager():
             # 
             await self.app.disconnect()
 
-    async def invite_user_to_channal(self, group_or_channel: str, user_name: str = "my_account") -> dict:
+    async def invite_user_to_channal(self, group_or_channel: str, user_name: str = "my_account") -> InviteOutcome | InviteError:
         """เพิ่มผู้ใช้เข้า group หรือ channel"""
         try:
             # ตรวจสอบการเชื่อมต่อ
@@ -110,37 +342,33 @@ class TelegramSessionManager():
                         user_ids=user
                     )
                     logging.info(f"✅ เพิ่ม {user} เข้า {chat_id} สำเร็จ!")
-                    results.append({"user": user, "status": "success"})
+                    results.append(InviteResult(user=user, status="success"))
                     # หน่วงเวลาเพื่อป้องกัน rate limit
                     await asyncio.sleep(3)
                     
                 except UserPrivacyRestricted:
                     logging.warning(f"❌ ไม่สามารถเพิ่ม {user} ได้: ตั้งค่าความเป็นส่วนตัว")
-                    results.append({"user": user, "status": "failed", "reason": "privacy_restricted"})
+                    results.append(FailedInviteResult(user=user, status="failed", reason="privacy_restricted"))
                     
                 except PeerIdInvalid:
                     logging.warning(f"❌ ไม่พบ {user} หรือ {chat_id}")
-                    results.append({"user": user, "status": "failed", "reason": "not_found"})
+                    results.append(FailedInviteResult(user=user, status="failed", reason="not_found"))
                     
                 except FloodWait as e:
                     logging.warning(f"⏳ ต้องรอ {e.value} วินาทีเนื่องจาก rate limit")
                     await asyncio.sleep(e.value)
-                    results.append({"user": user, "status": "waiting", "wait_seconds": e.value})
+                    results.append(WaitingInviteResult(user=user, status="waiting", wait_seconds=e.value))
                     
                 except Exception as e:
                     logging.error(f"❌ เกิดข้อผิดพลาดกับ {user}: {str(e)}")
-                    results.append({"user": user, "status": "failed", "reason": str(e)})
+                    results.append(FailedInviteResult(user=user, status="failed", reason=str(e)))
             
-            return {"status": "completed", "results": results}
+            return InviteOutcome(status="completed", results=results)
             
         except Exception as e:
             # จัดการข้อผิดพลาดในระดับฟังก์ชัน
             logging.error(f"❌ เกิดข้อผิดพลาดในฟังก์ชัน invite_user_to_channal: {str(e)}")
-            return {
-                "status": "error", 
-                "message": str(e),
-                "results": []
-            }
+            return InviteError(status="error", message=str(e))
             
         finally:
             # ตัดการเชื่อมต่ออย่างปลอดภัย
@@ -153,38 +381,4 @@ class TelegramSessionManager():
                 logging.warning(f"Error during disconnect: {e}")
                 
     def update_env(self) -> None:
-        dotenv_file = find_dotenv()
-
-        # อ่านไฟล์ทั้งหมด
-        with open(dotenv_file, "r") as file:
-            content = file.read()
-
-        logging.info("=== ค่าเดิม ===")
-        logging.info(content)
-
-        # แทนที่หรือเพิ่มบรรทัดใหม่
-        lines = content.split('\n')
-        new_lines = []
-        found = False
-
-        for line in lines:
-            if line.strip().startswith(f'{self.account_name}_session_string='):
-                new_lines.append(f"{self.account_name}_session_string={self.session_string}")
-                found = True
-            else:
-                new_lines.append(line)
-
-        # ถ้าไม่เจอ ให้เพิ่มใหม่
-        if not found:
-            new_lines.append(f"{self.account_name}_session_string={self.session_string}")
-
-        # เขียนกลับ
-        new_content = '\n'.join(new_lines)
-        with open(dotenv_file, "w") as file:
-            file.write(new_content)
-
-        logging.info("=== ค่าใหม่ ===")
-        with open(dotenv_file, "r") as file:
-            final_content = file.read()
-            logging.info(final_content)
-            
\ No newline at end of file
+        write_session_string_to_env(self.account_name, self.session_string)
@@ -3,16 +3,21 @@ import builtins
 from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel, Field
 from typing import Dict, Any, List, Optional
 import logging
 import os
 import secrets
 from dotenv import load_dotenv, set_key, find_dotenv, dotenv_values
-from TelegramSessionManager import TelegramSessionManager
+from TelegramSessionManager import TelegramSessionManager, load_session_encryption_key, load_session_string, migrate_plaintext_session_strings
 
 load_dotenv()
 logging.basicConfig(level=logging.INFO)
+# ตรวจสอบ key เข้ารหัส session ตั้งแต่ start (ก่อนส่งรหัสยืนยันซึ่งใช้ได้ครั้งเดียว)
+load_session_encryption_key()
+# เข้ารหัส session string แบบ plaintext ที่เหลือจากเวอร์ชันเดิม
+migrate_plaintext_session_strings()
 # สร้าง custom input function
 import uvicorn
 
@@ -338,6 +343,7 @@ async def create_session(data: CreateSession):
     - ลิงก์เชิญ: `https://t.me/mychannel`
     """,
     tags=["การจัดการผู้ใช้"],
+    response_class=ORJSONResponse,
     responses={
         200: {
             "description": "เชิญผู้ใช้สำเร็จ",
@@ -383,9 +389,11 @@ async def invite_user(data: InviteUser):
     logging.info(f"Account name: {data.account_phone_number}\naccount_name in dotenv: {data.account_phone_number in list(set([k.split("_")[0] for k in dotenv_keys]))}\nhas session string: {os.getenv(f"{data.account_phone_number}_session_string") is not None}")
     try :
         if data.account_phone_number in list(set([k.split("_")[0] for k in dotenv_keys])) and os.getenv(f"{data.account_phone_number}_session_string") is not None:
-            telegram_manager1 = TelegramSessionManager(account_name=data.account_phone_number,session_string=os.getenv(f"{data.account_phone_number}_session_string"))
+            session_string = await load_session_string(data.account_phone_number)
+            telegram_manager1 = TelegramSessionManager(account_name=data.account_phone_number,session_string=session_string)
             result = await telegram_manager1.invite_user_to_channal(group_or_channel=data.channal_or_group, user_name=data.username)
-            return result
+            # ส่ง dataclass ให้ orjson serialize โดยตรง (ข้าม jsonable_encoder)
+            return ORJSONResponse(content=result)
         else:
             raise HTTPException(status_code=400, detail="ไม่พบชื่อบัญชีหรือไม่มี session string")
     except Exception as e:
@@ -414,6 +422,7 @@ async def invite_user(data: InviteUser):
     """,
     tags=["การจัดการบัญชี"],
     response_model=AccountListResponse,
+    response_class=ORJSONResponse,
     responses={
         200: {
             "description": "แสดงรายการบัญชีสำเร็จ",
@@ -445,8 +454,8 @@ async def check_configured_accounts(token: str = Depends(verify_token)):
     load_dotenv()
     env_values = dotenv_values(".env")
     
-    # รวบรวมชื่อบัญชีทั้งหมด
-    account_names = list(set([k.split("_")[0] for k in env_values.keys() if "_" in k]))
+    # รวบรวมชื่อบัญชีทั้งหมด (เรียงตามชื่อบัญชี)
+    account_names = sorted(set([k.split("_")[0] for k in env_values.keys() if "_" in k]))
     accounts = []
     
     for account_name in account_names:
@@ -471,23 +480,21 @@ async def check_configured_accounts(token: str = Depends(verify_token)):
                 else:
                     phone_number = f"{full_number[:3]}{'x' * (len(full_number)-3)}"
         
-        account_info = AccountInfo(
-            account_name=account_name,
-            has_api_id=has_api_id,
-            has_api_hash=has_api_hash,
-            has_phone_number=has_phone_number,
-            has_session_string=has_session_string,
-            phone_number=phone_number
-        )
-        accounts.append(account_info)
-    
-    # เรียงตามชื่อบัญชี
-    accounts.sort(key=lambda x: x.account_name)
+        # ใช้ dict ตามโครงสร้าง AccountInfo แทนการสร้าง pydantic model ทีละบัญชี
+        accounts.append({
+            "account_name": account_name,
+            "has_api_id": has_api_id,
+            "has_api_hash": has_api_hash,
+            "has_phone_number": has_phone_number,
+            "has_session_string": has_session_string,
+            "phone_number": phone_number
+        })
     
-    return AccountListResponse(
-        total_accounts=len(accounts),
-        accounts=accounts
-    )
+    # ส่ง ORJSONResponse โดยตรงเพื่อข้ามการ validate/serialize ซ้ำของ FastAPI
+    return ORJSONResponse(content={
+        "total_accounts": len(accounts),
+        "accounts": accounts
+    })
 
 def run_fastapi():
     """
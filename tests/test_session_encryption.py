@@ -0,0 +1,62 @@
+import pytest
+
+import TelegramSessionManager as tsm
+
+
+@pytest.fixture(autouse=True)
+def session_crypto(tmp_path, monkeypatch):
+    """ใช้ .env ชั่วคราวและล้าง state ของ module ระหว่าง test"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("SESSION_ENCRYPTION_KEY_FILE", raising=False)
+    monkeypatch.setenv("SESSION_ENCRYPTION_KEY", "test-passphrase")
+    monkeypatch.setattr(tsm, "_session_encryption_key", None)
+    monkeypatch.setattr(tsm, "_fernet_cache", {})
+    monkeypatch.setattr(tsm, "_session_cache", {})
+    return tmp_path
+
+
+def test_encrypt_decrypt_round_trip():
+    encrypted = tsm.encrypt_session_string("secret-session")
+    assert encrypted.startswith(tsm.SESSION_ENCRYPTION_PREFIX)
+    assert "secret-session" not in encrypted
+    assert tsm.decrypt_session_string("0912345678", encrypted) == "secret-session"
+
+
+@pytest.mark.parametrize("stored_value", [
+    "enc:v1:no-separator",
+    "enc:v1:!!!:token",
+    "enc:v1:AAAAAAAAAAAAAAAAAAAAAA==:not-a-fernet-token",
+])
+def test_corrupt_value_raises_per_account_error(stored_value):
+    with pytest.raises(RuntimeError, match="corrupt or undecryptable session string for 0912345678"):
+        tsm.decrypt_session_string("0912345678", stored_value)
+
+
+def test_refuses_key_stored_in_dotenv(session_crypto):
+    (session_crypto / ".env").write_text("SESSION_ENCRYPTION_KEY=leaked\n")
+    with pytest.raises(RuntimeError, match="must not be stored in .env"):
+        tsm.load_session_encryption_key()
+
+
+def test_migration_rewrites_only_session_string_lines(session_crypto, monkeypatch):
+    monkeypatch.setenv("0912345678_session_string", "")
+    monkeypatch.setenv("0917598103_session_string", "")
+    dotenv_file = session_crypto / ".env"
+    dotenv_file.write_text(
+        "API_BEARER_TOKEN=token\n"
+        "0912345678_api_id=12345678\n"
+        "0912345678_session_string=plain-one\n"
+        "0917598103_phone_number=+66917598103\n"
+        "0917598103_session_string=plain-two"
+    )
+
+    tsm.migrate_plaintext_session_strings()
+
+    lines = dotenv_file.read_text().split("\n")
+    assert lines[0] == "API_BEARER_TOKEN=token"
+    assert lines[1] == "0912345678_api_id=12345678"
+    assert lines[3] == "0917598103_phone_number=+66917598103"
+    first = lines[2].split("=", 1)[1]
+    second = lines[4].split("=", 1)[1]
+    assert tsm.decrypt_session_string("0912345678", first) == "plain-one"
+    assert tsm.decrypt_session_string("0917598103", second) == "plain-two"